@@ -0,0 +1,278 @@
+"""Compiled kernels for grid cluster detection and fall collision.
+
+These run every frame (the fall loop probes collision up to 10 times per
+frame), so they are written as tight integer loops over the int8 grid
+and compiled with Numba when it is available.  Without Numba the same
+functions run as plain Python over the ndarray.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except ImportError:  # pragma: no cover - numba is an optional speedup
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+
+        def wrap(func):
+            return func
+        return wrap
+
+
+@njit(cache=True)
+def detect_clusters_mask(grid, out_mask):
+    """Mark every cell that is part of a 2x2 same-color block.
+
+    Only normal colors (ids 1-4) cluster.  Any larger same-color
+    rectangle is a union of 2x2 blocks, so marking all 2x2 hits covers
+    extended clusters too.
+    """
+    height, width = grid.shape
+    out_mask[:, :] = False
+    for y in range(height - 1):
+        for x in range(width - 1):
+            c = grid[y, x]
+            if c < 1 or c > 4:
+                continue
+            if grid[y, x + 1] == c and grid[y + 1, x] == c and \
+                    grid[y + 1, x + 1] == c:
+                out_mask[y, x] = True
+                out_mask[y, x + 1] = True
+                out_mask[y + 1, x] = True
+                out_mask[y + 1, x + 1] = True
+    return out_mask
+
+# Neighbor offsets for the flood fills; arrays so Numba keeps the loop
+# over them in compiled code.
+_NBR_DX = np.array((1, -1, 0, 0), dtype=np.int8)
+_NBR_DY = np.array((0, 0, 1, -1), dtype=np.int8)
+# Cell id -> color id; mirrors COLOR_ID in core.puzzle_module.
+_COLOR_ID = np.array((0, 1, 2, 3, 4, 1, 2, 3, 4, 1, 2, 3, 4, 0),
+                     dtype=np.int8)
+_GARBAGE_ID_MIN = 9
+
+
+@njit(cache=True)
+def label_cluster_components(grid, mask, labels):
+    """Label connected same-color components of the cluster mask.
+
+    labels must arrive zeroed and receives 1..n per component; the
+    component count n is returned.  BFS over preallocated index arrays,
+    no Python allocation per cell.
+    """
+    height, width = grid.shape
+    queue_x = np.empty(height * width, np.int32)
+    queue_y = np.empty(height * width, np.int32)
+    n = 0
+    for y in range(height):
+        for x in range(width):
+            if not mask[y, x] or labels[y, x]:
+                continue
+            n += 1
+            color = grid[y, x]
+            labels[y, x] = n
+            queue_x[0] = x
+            queue_y[0] = y
+            head = 0
+            tail = 1
+            while head < tail:
+                cx = queue_x[head]
+                cy = queue_y[head]
+                head += 1
+                for i in range(4):
+                    nx = cx + _NBR_DX[i]
+                    ny = cy + _NBR_DY[i]
+                    if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                        continue
+                    if labels[ny, nx] or not mask[ny, nx]:
+                        continue
+                    if grid[ny, nx] != color:
+                        continue
+                    labels[ny, nx] = n
+                    queue_x[tail] = nx
+                    queue_y[tail] = ny
+                    tail += 1
+    return n
+
+
+@njit(cache=True)
+def flood_same_color(grid, start_x, start_y, color, out_x, out_y):
+    """Collect all normal blocks of the given color connected to a cell.
+
+    Writes coordinates into out_x/out_y (each sized >= grid.size) in
+    BFS order from the start cell and returns the count.  Breakers
+    count as their base color; garbage never matches.
+    """
+    height, width = grid.shape
+    if start_x < 0 or start_x >= width or start_y < 0 or start_y >= height:
+        return 0
+    visited = np.zeros((height, width), np.bool_)
+    queue_x = np.empty(height * width, np.int32)
+    queue_y = np.empty(height * width, np.int32)
+    queue_x[0] = start_x
+    queue_y[0] = start_y
+    visited[start_y, start_x] = True
+    head = 0
+    tail = 1
+    count = 0
+    while head < tail:
+        x = queue_x[head]
+        y = queue_y[head]
+        head += 1
+        piece = grid[y, x]
+        if piece == 0 or piece >= _GARBAGE_ID_MIN:
+            continue
+        if _COLOR_ID[piece] != color:
+            continue
+        out_x[count] = x
+        out_y[count] = y
+        count += 1
+        for i in range(4):
+            nx = x + _NBR_DX[i]
+            ny = y + _NBR_DY[i]
+            if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                continue
+            if visited[ny, nx]:
+                continue
+            visited[ny, nx] = True
+            queue_x[tail] = nx
+            queue_y[tail] = ny
+            tail += 1
+    return count
+
+
+@njit(cache=True)
+def detect_and_label(grid, out_mask, out_labels):
+    """Cluster mask and component labels in one compiled call.
+
+    Fills out_mask via detect_clusters_mask, zeroes and fills out_labels
+    via label_cluster_components, and returns the component count.  One
+    kernel boundary per grid mutation instead of two traversals driven
+    from Python.
+    """
+    detect_clusters_mask(grid, out_mask)
+    out_labels[:, :] = 0
+    return label_cluster_components(grid, out_mask, out_labels)
+
+
+@njit(cache=True)
+def advance_fall_kernel(grid, main_x, main_y, attached_dx, attached_dy,
+                        attached_position, sub_position, sub_positions,
+                        threshold, max_steps):
+    """Advance the falling pair by up to max_steps sub-steps.
+
+    Pure integer loop over the grid; stops early when the look-ahead
+    probe hits the floor or an occupied cell.  Returns
+    (steps_taken, sub_position, main_y, blocked).
+    """
+    height = grid.shape[0]
+    steps_taken = 0
+    blocked = False
+    while steps_taken < max_steps:
+        attached_x = main_x + attached_dx
+        attached_y = main_y + attached_dy
+        next_sub = sub_position + 1
+        # The probe looks one row down until the sub-step crosses the
+        # threshold, two rows after.
+        drop = 1 if next_sub <= threshold else 2
+
+        check_y = main_y + drop
+        if check_y >= height or grid[check_y, main_x]:
+            blocked = True
+        elif attached_position != 0:
+            check_y = attached_y + drop
+            if attached_position == 2:
+                if check_y >= height or grid[check_y, attached_x]:
+                    blocked = True
+            else:
+                if check_y >= height:
+                    blocked = True
+                elif check_y >= 0 and grid[check_y, attached_x]:
+                    blocked = True
+        if blocked:
+            break
+
+        sub_position = next_sub
+        if sub_position >= sub_positions:
+            sub_position = 0
+            main_y += 1
+        steps_taken += 1
+    return steps_taken, sub_position, main_y, blocked
+
+
+@njit(cache=True)
+def would_fit_below_kernel(grid, cluster_mask, main_x, main_y,
+                           attached_x, attached_y, attached_position):
+    """Whether the piece pair has room to keep falling.
+
+    A cell below only blocks the fall if it is occupied and not part of
+    a still-settling cluster.
+    """
+    height = grid.shape[0]
+
+    below_main = main_y + 1
+    if below_main >= height:
+        return False
+    if grid[below_main, main_x] and not cluster_mask[below_main, main_x]:
+        return False
+
+    if attached_position != 0:
+        below_attached = attached_y + 1
+        if below_attached >= height:
+            return False
+        if attached_position == 2:
+            if grid[below_attached, attached_x] and \
+                    not cluster_mask[below_attached, attached_x]:
+                return False
+        else:
+            if below_attached >= 0 and \
+                    grid[below_attached, attached_x] and \
+                    not cluster_mask[below_attached, attached_x]:
+                return False
+    return True
+
+
+if not _HAVE_NUMBA:
+    def detect_clusters_mask(grid, out_mask):  # noqa: F811
+        """Vectorized fallback used when Numba is unavailable.
+
+        Same contract as the compiled version: one relational pass over
+        the four 2x2 corner views instead of a Python-level cell loop.
+        """
+        a = grid[:-1, :-1]
+        hit = ((a >= 1) & (a <= 4) &
+               (a == grid[:-1, 1:]) &
+               (a == grid[1:, :-1]) &
+               (a == grid[1:, 1:]))
+        out_mask[:, :] = False
+        out_mask[:-1, :-1] |= hit
+        out_mask[:-1, 1:] |= hit
+        out_mask[1:, :-1] |= hit
+        out_mask[1:, 1:] |= hit
+        return out_mask
+
+
+def _warmup():
+    """Trigger JIT compilation at import time on a throwaway grid.
+
+    With cache=True the compiled code is reused from disk on later runs,
+    so a game frame never pays first-call compile latency.
+    """
+    grid = np.zeros((16, 6), dtype=np.int8)
+    mask = np.zeros((16, 6), dtype=np.bool_)
+    labels = np.zeros((16, 6), dtype=np.int16)
+    out = np.empty(96, dtype=np.int32)
+    detect_clusters_mask(grid, mask)
+    label_cluster_components(grid, mask, labels)
+    detect_and_label(grid, mask, labels)
+    flood_same_color(grid, 3, 1, 1, out, out.copy())
+    would_fit_below_kernel(grid, mask, 3, 1, 3, 0, 0)
+    advance_fall_kernel(grid, 3, 1, 0, -1, 0, 0, 20, 18, 1)
+
+
+if _HAVE_NUMBA:
+    _warmup()
@@ -0,0 +1,87 @@
+"""Compiled kernels for the piece rotation/wall-kick/flip hot path.
+
+The whole rotate -> wall-kick -> flip sequence is integer arithmetic plus
+occupancy probes, which makes it a good Numba target once the grid is a
+numeric ndarray.  Numba is optional: without it the same functions run as
+plain Python, so behaviour is identical either way.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except ImportError:  # pragma: no cover - numba is an optional speedup
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+
+        def wrap(func):
+            return func
+        return wrap
+
+# Attached-block and wall-kick offsets, indexed by attached_position
+# (0 = above, 1 = right, 2 = below, 3 = left).  Kept as plain tuples so
+# Numba folds them into the compiled code as constants.
+_ATTACH_DX = (0, 1, 0, -1)
+_ATTACH_DY = (-1, 0, 1, 0)
+_KICK_DX = (0, -1, 0, 1)
+_KICK_DY = (1, 0, -1, 0)
+
+
+@njit(cache=True)
+def _cell_open(grid, x, y, grid_w, grid_h):
+    if x < 0 or x >= grid_w:
+        return False
+    if y >= grid_h:
+        return False
+    if y < 0:
+        # Above the buffer rows; open space for spawning pieces.
+        return True
+    return grid[y, x] == 0
+
+
+@njit(cache=True)
+def rotate_kernel(grid, main_x, main_y, attached_position, direction,
+                  grid_w, grid_h):
+    """Rotate with wall-kick fallback against an occupancy grid.
+
+    Returns (success, new_main_x, new_main_y, new_attached_position).
+    """
+    new_position = (attached_position + direction) % 4
+    adx = _ATTACH_DX[new_position]
+    ady = _ATTACH_DY[new_position]
+
+    if _cell_open(grid, main_x + adx, main_y + ady, grid_w, grid_h):
+        return True, main_x, main_y, new_position
+
+    # Wall kick: shove the main block one cell away from the blocked side.
+    kx = main_x + _KICK_DX[new_position]
+    ky = main_y + _KICK_DY[new_position]
+    if _cell_open(grid, kx, ky, grid_w, grid_h) and \
+            _cell_open(grid, kx + adx, ky + ady, grid_w, grid_h):
+        return True, kx, ky, new_position
+
+    return False, main_x, main_y, attached_position
+
+
+@njit(cache=True)
+def flip_kernel(grid, main_x, main_y, attached_position, grid_w, grid_h):
+    """Validity probe for a vertical flip (positions 0 and 2 only)."""
+    if attached_position != 0 and attached_position != 2:
+        return False
+    ady = _ATTACH_DY[attached_position]
+    return _cell_open(grid, main_x, main_y + ady, grid_w, grid_h)
+
+
+def _warmup():
+    """Trigger JIT compilation at import time on a throwaway grid."""
+    grid = np.zeros((16, 6), dtype=np.int8)
+    rotate_kernel(grid, 3, 1, 0, 1, 6, 16)
+    flip_kernel(grid, 3, 1, 0, 6, 16)
+
+
+if _HAVE_NUMBA:
+    _warmup()
@@ -0,0 +1,390 @@
+import heapq
+from functools import partial
+
+import pygame
+
+# The only event types the game reacts to.  Pulling just these from the
+# queue keeps irrelevant traffic (mouse motion, window/audio events, which
+# can be dozens per frame) out of the handler loop entirely.
+HANDLED_EVENT_TYPES = (pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP,
+                       pygame.MOUSEBUTTONDOWN)
+
+# Spacebar diagnostics.  Guarded by __debug__ as well so running with -O
+# removes the branches from the bytecode entirely.
+DEBUG_SPACEBAR = False
+
+
+def set_debug_spacebar(enabled):
+    """Toggle spacebar debug output for all input handlers."""
+    global DEBUG_SPACEBAR
+    DEBUG_SPACEBAR = enabled
+
+
+class InputHandler:
+    """Keyboard and mouse input with fixed arrow-key bindings."""
+
+    def __init__(self, puzzle_engine):
+        self.engine = puzzle_engine
+        self._rebind_engine_methods()
+        self.keys_pressed = {}
+        # key -> absolute tick at which the next auto-repeat fires; the
+        # heap holds (fire_at, key) pairs so the idle-frame check is one
+        # root comparison.  Entries invalidated by release/reschedule are
+        # discarded lazily when popped.
+        self.next_fire_time = {}
+        self._repeat_heap = []
+        # Rotation keydowns accumulate here and are applied as one net
+        # rotation per frame, so autorepeat floods cost a single call.
+        self._net_rotation = 0
+        self.key_repeat_delay = 170
+        self.key_repeat_interval = 50
+        self.arrow_repeat_interval = 50
+        self.rotate_repeat_interval = 150
+        self._rebuild_continuous_table()
+
+    def _rebind_engine_methods(self):
+        # Bound-method caches: hot paths call through these locals-of-self
+        # instead of walking self -> engine -> method on every event.
+        engine = self.engine
+        self._move = engine.move_piece
+        self._rotate = engine.rotate_attached_piece
+        self._flip = engine.flip_pieces_vertically
+        self._micro = engine._calculate_micro_fall_time
+
+    def _rebuild_continuous_table(self):
+        # key -> (repeat interval, zero-arg action); the repeat loop is a
+        # single dict probe plus a call per held key.
+        self._continuous_handlers = {
+            pygame.K_LEFT: (self.arrow_repeat_interval,
+                            partial(self._move, -1, 0)),
+            pygame.K_RIGHT: (self.arrow_repeat_interval,
+                             partial(self._move, 1, 0)),
+            pygame.K_UP: (self.rotate_repeat_interval,
+                          partial(self._rotate, 1)),
+            pygame.K_DOWN: (self.rotate_repeat_interval,
+                            partial(self._rotate, -1)),
+        }
+
+    def rebind_engine(self, puzzle_engine):
+        """Point the handler at a different engine instance."""
+        self.engine = puzzle_engine
+        self._rebind_engine_methods()
+        self._rebuild_continuous_table()
+
+    def process_events(self, events=None):
+        """Handle the frame's event batch plus held-key repeats."""
+        if events is None:
+            events = pygame.event.get(HANDLED_EVENT_TYPES)
+        # One timestamp for the whole invocation; every event and repeat
+        # decision this frame shares the same 'now'.
+        now = pygame.time.get_ticks()
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.engine.game_active = False
+            elif event.type == pygame.KEYDOWN:
+                self._handle_key_press(event, now)
+            elif event.type == pygame.KEYUP:
+                self._handle_key_release(event)
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                self._handle_mouse_click(event)
+        net = self._net_rotation
+        if net:
+            self._net_rotation = 0
+            if net % 4:
+                self._rotate(net)
+        if self.engine.game_active and self._repeat_heap:
+            self._handle_continuous_keys(now)
+
+    def _handle_mouse_click(self, event):
+        # Only the left button does anything; bail before touching the
+        # button list for right/middle/wheel clicks.
+        if event.button != 1:
+            return
+        # The event already carries the click position; asking SDL again
+        # via pygame.mouse.get_pos() is a wasted round-trip.
+        mouse_pos = event.pos
+        buttons = self.engine.game_buttons
+        action = next((b["action"] for b in buttons
+                       if b["rect"].collidepoint(mouse_pos)), None)
+        if action is not None:
+            self.engine.handle_button_action(action)
+
+    def _handle_key_press(self, event, now=None):
+        current_time = pygame.time.get_ticks() if now is None else now
+        self.keys_pressed[event.key] = current_time
+        if event.key in self._continuous_handlers:
+            fire_at = current_time + self.key_repeat_delay
+            self.next_fire_time[event.key] = fire_at
+            heapq.heappush(self._repeat_heap, (fire_at, event.key))
+
+        if not self.engine.game_active:
+            return
+        if event.key == pygame.K_LEFT:
+            self._move(-1, 0)
+        elif event.key == pygame.K_RIGHT:
+            self._move(1, 0)
+        elif event.key == pygame.K_UP:
+            self._net_rotation += 1
+        elif event.key == pygame.K_DOWN:
+            self._net_rotation -= 1
+        elif event.key == pygame.K_SPACE:
+            self._handle_spacebar_press()
+
+    def _handle_key_release(self, event):
+        self.keys_pressed.pop(event.key, None)
+        self.next_fire_time.pop(event.key, None)
+        if event.key == pygame.K_SPACE:
+            self._handle_spacebar_release()
+
+    def _handle_spacebar_press(self):
+        if __debug__ and DEBUG_SPACEBAR:
+            print(f"DEBUG: spacebar pressed, accelerating fall "
+                  f"({self.engine.current_fall_speed} -> "
+                  f"{self.engine.accelerated_fall_speed})")
+        # No-op when already accelerated (e.g. OS key-repeat KEYDOWNs),
+        # so the micro-time recompute runs once per press.
+        if self.engine.current_fall_speed != self.engine.accelerated_fall_speed:
+            self.engine.current_fall_speed = self.engine.accelerated_fall_speed
+            self.engine.micro_fall_time = self._micro(
+                self.engine.current_fall_speed)
+
+    def _handle_spacebar_release(self):
+        if __debug__ and DEBUG_SPACEBAR:
+            print("DEBUG: spacebar released, back to normal fall speed")
+        if self.engine.current_fall_speed != self.engine.normal_fall_speed:
+            self.engine.current_fall_speed = self.engine.normal_fall_speed
+            self.engine.micro_fall_time = self._micro(
+                self.engine.current_fall_speed)
+
+    def _handle_continuous_keys(self, now=None):
+        """Fire repeat actions whose scheduled time has passed."""
+        current_time = pygame.time.get_ticks() if now is None else now
+        heap = self._repeat_heap
+        next_fire = self.next_fire_time
+        handlers = self._continuous_handlers
+        while heap and heap[0][0] <= current_time:
+            fire_at, key = heapq.heappop(heap)
+            if next_fire.get(key) != fire_at:
+                # Stale entry: the key was released or rescheduled.
+                continue
+            intv_fn = handlers.get(key)
+            if intv_fn is None:
+                del next_fire[key]
+                continue
+            interval, fn = intv_fn
+            fn()
+            # Advance by the interval so cadence is jitter-free; if the loop
+            # stalled badly, snap forward instead of burst-firing.
+            fire_at += interval
+            if current_time - fire_at > 2 * interval:
+                fire_at = current_time + interval
+            next_fire[key] = fire_at
+            heapq.heappush(heap, (fire_at, key))
+
+    def clear_action_from_keys(self):
+        """Forget a held action key (spacebar), e.g. on piece spawn."""
+        self.keys_pressed.pop(pygame.K_SPACE, None)
+        self.next_fire_time.pop(pygame.K_SPACE, None)
+
+    # Old name kept for existing callers.
+    clear_spacebar_from_keys = clear_action_from_keys
+
+    def set_debug_spacebar(self, enabled):
+        set_debug_spacebar(enabled)
+
+
+class ConfigurableInputHandler:
+    """Input handler with remappable controls.
+
+    Bindings come from a controls dict (action name -> pygame key constant)
+    so players can rebind movement; otherwise mirrors InputHandler.
+    """
+
+    DEFAULT_CONTROLS = {
+        'move_left': pygame.K_LEFT,
+        'move_right': pygame.K_RIGHT,
+        'move_up': pygame.K_UP,
+        'move_down': pygame.K_DOWN,
+        'action': pygame.K_SPACE,
+    }
+
+    def __init__(self, puzzle_engine, controls=None):
+        self.engine = puzzle_engine
+        self._rebind_engine_methods()
+        self.controls = dict(self.DEFAULT_CONTROLS)
+        if controls:
+            self.controls.update(controls)
+        self.keys_pressed = {}
+        # key -> absolute tick at which the next auto-repeat fires; the
+        # heap holds (fire_at, key) pairs so the idle-frame check is one
+        # root comparison.  Entries invalidated by release/reschedule are
+        # discarded lazily when popped.
+        self.next_fire_time = {}
+        self._repeat_heap = []
+        # Rotation keydowns accumulate here and are applied as one net
+        # rotation per frame, so autorepeat floods cost a single call.
+        self._net_rotation = 0
+        self.key_repeat_delay = 170
+        self.key_repeat_interval = 50
+        self.arrow_repeat_interval = 50
+        self.rotate_repeat_interval = 150
+        self._rebuild_control_cache()
+
+    def _rebind_engine_methods(self):
+        # Bound-method caches: hot paths call through these locals-of-self
+        # instead of walking self -> engine -> method on every event.
+        engine = self.engine
+        self._move = engine.move_piece
+        self._rotate = engine.rotate_attached_piece
+        self._flip = engine.flip_pieces_vertically
+        self._micro = engine._calculate_micro_fall_time
+
+    def _rebuild_control_cache(self):
+        # key -> (repeat interval, zero-arg action), derived from the
+        # current bindings; rebuilt whenever a control is remapped.
+        self._action_key = self.controls['action']
+        self._continuous_handlers = {
+            self.controls['move_left']: (self.arrow_repeat_interval,
+                                         partial(self._move, -1, 0)),
+            self.controls['move_right']: (self.arrow_repeat_interval,
+                                          partial(self._move, 1, 0)),
+            self.controls['move_up']: (self.rotate_repeat_interval,
+                                       partial(self._rotate, 1)),
+            self.controls['move_down']: (self.rotate_repeat_interval,
+                                         partial(self._rotate, -1)),
+        }
+
+    def rebind_engine(self, puzzle_engine):
+        """Point the handler at a different engine instance."""
+        self.engine = puzzle_engine
+        self._rebind_engine_methods()
+        self._rebuild_control_cache()
+
+    def set_control(self, action, key):
+        """Rebind an action to a new key."""
+        self.controls[action] = key
+        self._rebuild_control_cache()
+
+    def get_control(self, action):
+        """Key currently bound to the given action name."""
+        return self.controls.get(action)
+
+    def process_events(self, events=None):
+        """Handle the frame's event batch plus held-key repeats."""
+        if events is None:
+            events = pygame.event.get(HANDLED_EVENT_TYPES)
+        # One timestamp for the whole invocation; every event and repeat
+        # decision this frame shares the same 'now'.
+        now = pygame.time.get_ticks()
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.engine.game_active = False
+            elif event.type == pygame.KEYDOWN:
+                self._handle_key_press(event, now)
+            elif event.type == pygame.KEYUP:
+                self._handle_key_release(event)
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                self._handle_mouse_click(event)
+        net = self._net_rotation
+        if net:
+            self._net_rotation = 0
+            if net % 4:
+                self._rotate(net)
+        if self.engine.game_active and self._repeat_heap:
+            self._handle_continuous_keys(now)
+
+    def _handle_mouse_click(self, event):
+        if event.button != 1:
+            return
+        # Use the position carried by the event instead of re-querying SDL.
+        mouse_pos = event.pos
+        buttons = self.engine.game_buttons
+        action = next((b["action"] for b in buttons
+                       if b["rect"].collidepoint(mouse_pos)), None)
+        if action is not None:
+            self.engine.handle_button_action(action)
+
+    def _handle_key_press(self, event, now=None):
+        current_time = pygame.time.get_ticks() if now is None else now
+        self.keys_pressed[event.key] = current_time
+        if event.key in self._continuous_handlers:
+            fire_at = current_time + self.key_repeat_delay
+            self.next_fire_time[event.key] = fire_at
+            heapq.heappush(self._repeat_heap, (fire_at, event.key))
+
+        if not self.engine.game_active:
+            return
+        if event.key == self.get_control('move_left'):
+            self._move(-1, 0)
+        elif event.key == self.get_control('move_right'):
+            self._move(1, 0)
+        elif event.key == self.get_control('move_up'):
+            self._net_rotation += 1
+        elif event.key == self.get_control('move_down'):
+            self._net_rotation -= 1
+        elif event.key == self.get_control('action'):
+            self._handle_spacebar_press()
+
+    def _handle_key_release(self, event):
+        self.keys_pressed.pop(event.key, None)
+        self.next_fire_time.pop(event.key, None)
+        if event.key == self.get_control('action'):
+            self._handle_spacebar_release()
+
+    def _handle_spacebar_press(self):
+        if __debug__ and DEBUG_SPACEBAR:
+            print(f"DEBUG: action key pressed, accelerating fall "
+                  f"({self.engine.current_fall_speed} -> "
+                  f"{self.engine.accelerated_fall_speed})")
+        # No-op when already accelerated (e.g. OS key-repeat KEYDOWNs),
+        # so the micro-time recompute runs once per press.
+        if self.engine.current_fall_speed != self.engine.accelerated_fall_speed:
+            self.engine.current_fall_speed = self.engine.accelerated_fall_speed
+            self.engine.micro_fall_time = self._micro(
+                self.engine.current_fall_speed)
+
+    def _handle_spacebar_release(self):
+        if __debug__ and DEBUG_SPACEBAR:
+            print("DEBUG: action key released, back to normal fall speed")
+        if self.engine.current_fall_speed != self.engine.normal_fall_speed:
+            self.engine.current_fall_speed = self.engine.normal_fall_speed
+            self.engine.micro_fall_time = self._micro(
+                self.engine.current_fall_speed)
+
+    def _handle_continuous_keys(self, now=None):
+        """Fire repeat actions whose scheduled time has passed."""
+        current_time = pygame.time.get_ticks() if now is None else now
+        heap = self._repeat_heap
+        next_fire = self.next_fire_time
+        handlers = self._continuous_handlers
+        while heap and heap[0][0] <= current_time:
+            fire_at, key = heapq.heappop(heap)
+            if next_fire.get(key) != fire_at:
+                # Stale entry: the key was released or rescheduled.
+                continue
+            intv_fn = handlers.get(key)
+            if intv_fn is None:
+                del next_fire[key]
+                continue
+            interval, fn = intv_fn
+            fn()
+            # Advance by the interval so cadence is jitter-free; if the loop
+            # stalled badly, snap forward instead of burst-firing.
+            fire_at += interval
+            if current_time - fire_at > 2 * interval:
+                fire_at = current_time + interval
+            next_fire[key] = fire_at
+            heapq.heappush(heap, (fire_at, key))
+
+    def clear_action_from_keys(self):
+        """Forget a held action key, e.g. when a new piece spawns."""
+        action_key = self._action_key
+        self.keys_pressed.pop(action_key, None)
+        self.next_fire_time.pop(action_key, None)
+
+    # Old names kept for existing callers.
+    clear_action_keys = clear_action_from_keys
+    clear_spacebar_from_keys = clear_action_from_keys
+
+    def set_debug_spacebar(self, enabled):
+        set_debug_spacebar(enabled)
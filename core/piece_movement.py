@@ -0,0 +1,256 @@
+import time
+
+from core._piece_movement_kernels import rotate_kernel
+
+
+def _now_ms():
+    """Millisecond timestamp without the SDL tick round-trip.
+
+    All movement cooldown fields are produced and consumed with this
+    clock, so it never mixes with pygame.time.get_ticks() values.
+    """
+    return time.monotonic_ns() // 1_000_000
+
+# (dx, dy) of the attached block for each attached_position value
+# (0 = above, 1 = right, 2 = below, 3 = left).
+_ATTACH_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+# How the main block gets shoved when a rotation into attached_position N
+# hits a wall: always one cell away from the blocked side.
+_KICK_OFFSETS = ((0, 1), (-1, 0), (0, -1), (1, 0))
+
+
+class PieceMovement:
+    """Rotation, wall kicks and vertical flips for the falling piece pair.
+
+    This is the newer movement implementation; it operates on the engine's
+    piece state directly and keeps its own cooldown bookkeeping so rotation
+    can't be spammed through walls.
+    """
+
+    __slots__ = ('engine', 'grid_width', 'grid_height',
+                 'wall_kick_cooldown', 'max_wall_kicks', 'flip_cooldown',
+                 '_flip_cache_key', '_flip_cache_value', '_info_out')
+
+    def __init__(self, puzzle_engine):
+        self.engine = puzzle_engine
+        self.grid_width = puzzle_engine.grid_width
+        self.grid_height = puzzle_engine.total_grid_height
+
+        self.wall_kick_cooldown = 300
+        self.max_wall_kicks = 2
+        self.flip_cooldown = 150
+
+        # can_flip_vertically memo: UI asks right before the flip itself,
+        # so the second check in a frame is a cache hit.
+        self._flip_cache_key = None
+        self._flip_cache_value = False
+
+        # Reused get_movement_info output; the constant fields are filled
+        # in once here, the live ones are overwritten per call.
+        self._info_out = {
+            'wall_kick_count': 0,
+            'max_wall_kicks': self.max_wall_kicks,
+            'wall_kick_cooldown': self.wall_kick_cooldown,
+            'wall_kick_ready': True,
+            'flip_cooldown': self.flip_cooldown,
+            'flip_ready': True,
+            'attached_position': 0,
+            'piece_position': [0, 0],
+        }
+
+    # ------------------------------------------------------------------
+    # Cooldown timing - the engine owns these fields; delegating through
+    # properties keeps one source of truth with no sync round-trips.
+    # ------------------------------------------------------------------
+
+    @property
+    def last_wall_kick_time(self):
+        return self.engine.last_wall_kick_time
+
+    @last_wall_kick_time.setter
+    def last_wall_kick_time(self, value):
+        self.engine.last_wall_kick_time = value
+
+    @property
+    def wall_kick_count(self):
+        return self.engine.wall_kick_count
+
+    @wall_kick_count.setter
+    def wall_kick_count(self, value):
+        self.engine.wall_kick_count = value
+
+    @property
+    def last_flip_time(self):
+        return self.engine.last_flip_time
+
+    @last_flip_time.setter
+    def last_flip_time(self, value):
+        self.engine.last_flip_time = value
+
+    # ------------------------------------------------------------------
+    # Rotation
+    # ------------------------------------------------------------------
+
+    def rotate_attached_piece(self, direction):
+        """Rotate the attached block around the main block.
+
+        direction is +1 for clockwise, -1 for counter-clockwise.  Falls
+        back to a wall kick when the target cell is blocked.
+        """
+        engine = self.engine
+        pos = engine.piece_position
+        main_x, main_y = pos
+
+        grid_array = getattr(engine, 'grid_array', None)
+        if grid_array is not None:
+            # Numeric grid available: run the whole rotate + wall-kick
+            # probe as one compiled kernel call.
+            ok, kx, ky, kpos = rotate_kernel(
+                grid_array, main_x, main_y, engine.attached_position,
+                direction, self.grid_width, self.grid_height)
+            if not ok:
+                return False
+            if kx != main_x or ky != main_y:
+                current_time = _now_ms()
+                if (self.wall_kick_count >= self.max_wall_kicks) & \
+                        (current_time - self.last_wall_kick_time
+                         < self.wall_kick_cooldown):
+                    return False
+                pos[0] = kx
+                pos[1] = ky
+                self.last_wall_kick_time = current_time
+                self.wall_kick_count += 1
+            engine.attached_position = kpos
+            return True
+
+        new_position = (engine.attached_position + direction) % 4
+        dx, dy = _ATTACH_OFFSETS[new_position]
+        attached_x, attached_y = main_x + dx, main_y + dy
+
+        if engine.is_valid_position(attached_x, attached_y):
+            engine.attached_position = new_position
+            return True
+        return self._attempt_wall_kick(new_position)
+
+    def _calculate_attached_position(self, main_x, main_y, attached_position):
+        """Grid coordinates of the attached block for a given orientation."""
+        dx, dy = _ATTACH_OFFSETS[attached_position]
+        return main_x + dx, main_y + dy
+
+    def _attempt_wall_kick(self, new_position):
+        """Try to shove the main block one cell so the rotation fits."""
+        engine = self.engine
+        current_time = _now_ms()
+        # Non-short-circuiting & keeps this a single predictable test
+        # instead of two dependent jumps.
+        if (self.wall_kick_count >= self.max_wall_kicks) & \
+                (current_time - self.last_wall_kick_time < self.wall_kick_cooldown):
+            return False
+
+        kick_dx, kick_dy = _KICK_OFFSETS[new_position]
+        attach_dx, attach_dy = _ATTACH_OFFSETS[new_position]
+        is_valid = engine.is_valid_position
+        pos = engine.piece_position
+        # Each coordinate is read exactly once, so index directly instead
+        # of paying UNPACK_SEQUENCE.
+        new_main_x = pos[0] + kick_dx
+        new_main_y = pos[1] + kick_dy
+
+        if is_valid(new_main_x, new_main_y) and \
+                is_valid(new_main_x + attach_dx,
+                         new_main_y + attach_dy):
+            pos[0] = new_main_x
+            pos[1] = new_main_y
+            engine.attached_position = new_position
+            self.last_wall_kick_time = current_time
+            self.wall_kick_count += 1
+            return True
+        return False
+
+    # ------------------------------------------------------------------
+    # Vertical flip
+    # ------------------------------------------------------------------
+
+    def can_flip_vertically(self):
+        """True when the pair is stacked vertically and the swap fits."""
+        engine = self.engine
+        # Odd positions (1/3) are horizontal, even (0/2) vertical; the
+        # % 4 in rotation keeps the value in range, so the low bit is
+        # enough to reject horizontal pairs without building a list.
+        if engine.attached_position & 1:
+            return False
+        pos = engine.piece_position
+        main_x, main_y = pos
+        key = (main_x, main_y, engine.attached_position)
+        if key == self._flip_cache_key:
+            return self._flip_cache_value
+        attached_x, attached_y = self._calculate_attached_position(
+            main_x, main_y, engine.attached_position)
+        result = engine.is_valid_position(attached_x, attached_y)
+        self._flip_cache_key = key
+        self._flip_cache_value = result
+        return result
+
+    def flip_pieces_vertically(self):
+        """Swap the main and attached blocks when stacked vertically."""
+        engine = self.engine
+        current_time = _now_ms()
+        if current_time - self.last_flip_time < self.flip_cooldown:
+            return False
+        if not self.can_flip_vertically():
+            return False
+
+        is_valid = engine.is_valid_position
+        main_x, main_y = engine.piece_position
+        # The main block already occupies (main_x, main_y), so its cell
+        # can't be invalid; only the attached cell needs probing.
+        assert is_valid(main_x, main_y)
+        if engine.attached_position == 0:
+            if is_valid(main_x, main_y - 1):
+                engine.piece_type, engine.attached_piece_type = \
+                    engine.attached_piece_type, engine.piece_type
+                self.last_flip_time = current_time
+                self._flip_cache_key = None
+                return True
+        elif engine.attached_position == 2:
+            if is_valid(main_x, main_y + 1):
+                engine.piece_type, engine.attached_piece_type = \
+                    engine.attached_piece_type, engine.piece_type
+                self.last_flip_time = current_time
+                self._flip_cache_key = None
+                return True
+        return False
+
+    # ------------------------------------------------------------------
+    # State queries and syncing
+    # ------------------------------------------------------------------
+
+    def get_movement_info(self):
+        """Snapshot of the movement cooldown state for the HUD.
+
+        The same dict object is returned on every call to avoid per-frame
+        allocation churn; callers must treat it as read-only.
+        """
+        now = _now_ms()
+        info = self._info_out
+        info['wall_kick_count'] = self.wall_kick_count
+        info['wall_kick_ready'] = now - self.last_wall_kick_time \
+            >= self.wall_kick_cooldown
+        info['flip_ready'] = now - self.last_flip_time >= self.flip_cooldown
+        info['attached_position'] = self.engine.attached_position
+        pos = self.engine.piece_position
+        info['piece_position'][0] = pos[0]
+        info['piece_position'][1] = pos[1]
+        return info
+
+    def reset_wall_kick_tracking(self):
+        """Clear kick counters; called when a piece lands or moves down."""
+        self.wall_kick_count = 0
+        self._flip_cache_key = None
+
+    def update_timing_from_engine(self):
+        """No-op: the engine owns the timing fields directly now."""
+
+    def sync_timing_to_engine(self):
+        """No-op: the engine owns the timing fields directly now."""
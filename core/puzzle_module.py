@@ -0,0 +1,1029 @@
+import pygame
+import os
+from collections import deque
+from types import MappingProxyType
+
+import numpy as np
+
+from core.piece_movement import PieceMovement
+from core._grid_kernels import (advance_fall_kernel, detect_and_label,
+                                flood_same_color, would_fit_below_kernel)
+
+# Grid cell encoding.  The grid is an int8 ndarray; 0 is empty, 1-4 are
+# the normal colors, 5-8 the matching breakers, 9-12 colored garbage and
+# 13 gray garbage.  Layout is chosen so that the color of any cell is a
+# table lookup and breaker/garbage tests are range compares.
+EMPTY = 0
+PIECE_ID = {
+    'red': 1, 'blue': 2, 'green': 3, 'yellow': 4,
+    'red_breaker': 5, 'blue_breaker': 6,
+    'green_breaker': 7, 'yellow_breaker': 8,
+    'red_garbage': 9, 'blue_garbage': 10,
+    'green_garbage': 11, 'yellow_garbage': 12,
+    'gray_garbage': 13,
+}
+ID_PIECE = {v: k for k, v in PIECE_ID.items()}
+BREAKER_ID_MIN = 5
+BREAKER_ID_MAX = 8
+GARBAGE_ID_MIN = 9
+# Cell id -> color id (1-4); 0 for empty and gray garbage.  The ndarray
+# twin serves vectorized whole-grid lookups (COLOR_ID_ARR[grid]).
+COLOR_ID = (0, 1, 2, 3, 4, 1, 2, 3, 4, 1, 2, 3, 4, 0)
+COLOR_ID_ARR = np.array(COLOR_ID, dtype=np.int8)
+
+# Breaker/chain diagnostics.  Guarded by __debug__ as well so running
+# with -O removes the branches from the bytecode entirely.
+DEBUG_BREAKERS = False
+
+
+class PuzzleEngine:
+    """Core engine for the puzzle battle mode.
+
+    Owns the grid, the falling piece pair, gravity, cluster detection,
+    breaker activation and the chain reaction state machine.  Rendering is
+    done elsewhere; the engine only exposes grid/piece state plus the block
+    surfaces loaded at construction time.
+    """
+
+    # Attached-block offset per attached_position (0 = above, 1 = right,
+    # 2 = below, 3 = left); one tuple index instead of an if/elif ladder.
+    _ATTACH_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+    # Wall-kick candidates per target attached_position: offsets applied
+    # to the main block when the plain rotation is blocked, tried in
+    # order.  Currently one candidate each (shove away from the blocked
+    # side); extra multi-step kicks are just more entries here.
+    _KICK_TABLE = (
+        ((0, 1),),    # attached wants above -> kick down
+        ((-1, 0),),   # attached wants right -> kick left
+        ((0, -1),),   # attached wants below -> kick up
+        ((1, 0),),    # attached wants left  -> kick right
+    )
+
+    # Immutable shared config, class-level so construction doesn't
+    # allocate a fresh copy per engine instance.
+    piece_types = ('red', 'blue', 'green', 'yellow',
+                   'red_breaker', 'blue_breaker',
+                   'green_breaker', 'yellow_breaker')
+    particle_colors = MappingProxyType({
+        'red': (220, 60, 60),
+        'blue': (70, 110, 230),
+        'green': (70, 200, 90),
+        'yellow': (230, 210, 70),
+        'gray': (150, 150, 150),
+    })
+
+    def __init__(self, width=800, height=600, asset_path="assets"):
+        self.width = width
+        self.height = height
+        self.asset_path = asset_path
+
+        # Grid geometry.  The visible playfield is grid_width x grid_height;
+        # a few hidden buffer rows on top give pieces room to spawn.
+        self.grid_width = 6
+        self.grid_height = 13
+        self.buffer_rows = 3
+        self.total_grid_height = self.grid_height + self.buffer_rows
+        self.block_size = 32
+
+        # Sub-grid positions give smooth falling between whole cells.
+        self.sub_grid_positions = 20
+        # fall_speed -> ms per sub-step; only two speeds exist in play,
+        # so the division runs once per distinct speed.
+        self._micro_cache = {}
+
+        self.game_active = False
+        self.game_buttons = []
+        self.score = 0
+
+        # Storage is one flat row-major int8 buffer; puzzle_grid is a 2D
+        # view of it, and column sweeps slice the flat buffer directly.
+        self._grid_flat = np.zeros(self.grid_width * self.total_grid_height,
+                                   dtype=np.int8)
+        self.puzzle_grid = self._grid_flat.reshape(self.total_grid_height,
+                                                   self.grid_width)
+        # Alias consumed by the compiled movement kernels, which only
+        # require a numeric 2D array with nonzero == occupied.
+        self.grid_array = self.puzzle_grid
+        # Cluster membership as a boolean mask - O(1) unhashed lookups
+        # and no per-cell tuple allocation; recomputed lazily after grid
+        # mutations instead of on every would_fit_below call.
+        self._cluster_mask = np.zeros(self.puzzle_grid.shape, dtype=np.bool_)
+        self._cluster_labels = np.zeros(self.puzzle_grid.shape,
+                                        dtype=np.int16)
+        self._cluster_label_count = 0
+        # Built list[set] form of the components, invalidated together
+        # with the mask so repeat callers on a quiet grid pay nothing.
+        self._all_clusters_cache = None
+        self._clusters_dirty = True
+        # Monotonic grid mutation counter plus cached blit batch; the
+        # batch is reused while the grid version and placement hold and
+        # nothing is animating.
+        self._grid_version = 0
+        self._blit_cache = None
+        self._blit_cache_key = None
+        # Scratch output buffers for the compiled flood fill; results are
+        # copied out before the next call, so one pair is enough.
+        self._flood_out_x = np.empty(self._grid_flat.size, dtype=np.int32)
+        self._flood_out_y = np.empty(self._grid_flat.size, dtype=np.int32)
+
+        # Falling piece pair: a main block plus one attached block.
+        # attached_position: 0 = above, 1 = right, 2 = below, 3 = left.
+        self.piece_position = [self.grid_width // 2, 1]
+        self.attached_position = 0
+        self.piece_type = 'red'
+        self.attached_piece_type = 'blue'
+        self.piece_active = False
+        self.next_piece_queue = []
+        # Batched RNG: piece ids are drawn 256 at a time with one
+        # vectorized call instead of per-piece random.random()/choice.
+        self._rng = np.random.default_rng()
+        self._piece_id_queue = deque()
+        # Memoized get_attached_position_coords result; position and
+        # orientation only change at discrete events, so most per-frame
+        # queries are cache hits.
+        self._attached_cache_key = None
+        self._attached_coords = [0, 0]
+        # Memoized get_grid_screen_params result, keyed on dimensions.
+        self._grid_params_key = None
+        self._grid_params_cache = None
+
+        # Tick value captured once at the top of update(); per-frame code
+        # reads this instead of calling pygame.time.get_ticks() repeatedly.
+        self.frame_tick = 0
+
+        # Movement cooldown timing.  The engine is the single owner of
+        # these; PieceMovement reads and writes them through properties.
+        self.last_wall_kick_time = 0
+        self.wall_kick_count = 0
+        self.last_flip_time = 0
+
+        # Sub-step at which the look-ahead collision probe starts seeing
+        # the cell two rows down instead of one; integer form of
+        # ceil(y + sub/positions + 0.1) used by the fall loop.
+        self._fall_check_threshold = self.sub_grid_positions - \
+            int(0.1 * self.sub_grid_positions)
+
+        # Fall timing (milliseconds per whole cell).
+        self.normal_fall_speed = 800
+        self.accelerated_fall_speed = 60
+        self.current_fall_speed = self.normal_fall_speed
+        self.micro_fall_time = self._calculate_micro_fall_time(self.current_fall_speed)
+        self.sub_position = 0
+        self.last_fall_time = 0
+
+        # Chain reaction state machine.
+        self.chain_reaction_in_progress = False
+        self.chain_state = "idle"
+        self.chain_count = 0
+        # Tick at which the current chain began; 0 when no chain is
+        # running, so hot paths test it directly instead of hasattr.
+        self.chain_start_time = 0
+        self.breaking_blocks = []
+        # Positions currently queued to break, mirrored from
+        # breaking_blocks for O(1) already-breaking membership tests.
+        self._breaking_positions = set()
+        self.breaking_animation_start = 0
+        self.breaking_animation_duration = 400
+        self.last_state_change = 0
+        # state -> bound handler; update_chain_reaction dispatches
+        # through this instead of an if/elif ladder.
+        self._chain_handlers = {
+            "breaking": self._chain_breaking,
+            "waiting_for_gravity": self._chain_waiting_for_gravity,
+            "waiting_for_breaking": self._chain_waiting_for_breaking,
+        }
+
+        # Optional hookups set by the game shell; plain None/empty
+        # defaults so hot paths test them directly instead of hasattr
+        # polling (which is a full lookup with exception handling).
+        self.input_handler = None
+        self.renderer = None
+        self.logger = None
+        self.last_animation_wait_time = 0
+        self.piece_generation_time = 0
+        self.animating_gravity_blocks = []
+        # (x, source_y) -> animation record, so per-block visual lookups
+        # are one dict probe instead of a list scan.
+        self._animating_by_source = {}
+
+        self.piece_movement = PieceMovement(self)
+
+        # Block surfaces, as one flat list indexed by the int8 cell id
+        # (index 0 is the empty cell).  The renderer's inner loop indexes
+        # this list directly with the grid value - no attribute lookup,
+        # no dict probe.  Garbage variants render as the gray block.
+        red = self.load_block('red_block.png')
+        blue = self.load_block('blue_block.png')
+        green = self.load_block('green_block.png')
+        yellow = self.load_block('yellow_block.png')
+        red_breaker = self.load_block('red_breaker.png')
+        blue_breaker = self.load_block('blue_breaker.png')
+        green_breaker = self.load_block('green_breaker.png')
+        yellow_breaker = self.load_block('yellow_breaker.png')
+        gray = self.load_block('gray_block.png')
+        self.block_surfaces = [
+            None,
+            red, blue, green, yellow,
+            red_breaker, blue_breaker, green_breaker, yellow_breaker,
+            gray, gray, gray, gray, gray,
+        ]
+
+        # Named aliases kept for existing callers.
+        self.red_block = red
+        self.blue_block = blue
+        self.green_block = green
+        self.yellow_block = yellow
+        self.red_breaker = red_breaker
+        self.blue_breaker = blue_breaker
+        self.green_breaker = green_breaker
+        self.yellow_breaker = yellow_breaker
+        self.gray_block = gray
+
+        try:
+            self.large_font = pygame.font.Font(None, 48)
+        except Exception:
+            self.large_font = None
+
+    # ------------------------------------------------------------------
+    # Assets
+    # ------------------------------------------------------------------
+
+    def load_block(self, filename):
+        """Load a block image and scale it to the grid block size."""
+        path = os.path.join(self.asset_path, filename)
+        try:
+            img = pygame.image.load(path)
+            img = pygame.transform.scale(img, (self.block_size, self.block_size))
+            # Convert to the display's pixel format once at load time so
+            # every later blit skips the per-blit format conversion.
+            # Skipped when no display exists (e.g. headless tests).
+            if pygame.display.get_surface() is not None:
+                img = img.convert_alpha()
+            return img
+        except Exception:
+            # Fall back to a flat colored square so the game still runs
+            # without art assets.
+            surf = pygame.Surface((self.block_size, self.block_size))
+            color = self.particle_colors.get(filename.split('_')[0], (200, 200, 200))
+            surf.fill(color)
+            return surf
+
+    # ------------------------------------------------------------------
+    # Grid management
+    # ------------------------------------------------------------------
+
+    def create_empty_grid(self, width, height):
+        """Create an empty grid of the given size."""
+        return np.zeros((height, width), dtype=np.int8)
+
+    def start_game(self):
+        """Reset all state and start a new game."""
+        # Zero the existing buffers in place (memset) rather than
+        # reallocating; this also keeps the grid_array alias and any
+        # kernel-side references valid across restarts.
+        self.puzzle_grid.fill(EMPTY)
+        self._cluster_mask.fill(False)
+        self._mark_grid_dirty()
+        self.score = 0
+        self.chain_reaction_in_progress = False
+        self.chain_state = "idle"
+        self.chain_count = 0
+        self.breaking_blocks = []
+        self._breaking_positions.clear()
+        self.next_piece_queue = []
+        self.game_active = True
+        self.generate_new_piece()
+
+    def get_grid_screen_params(self):
+        """Where the grid sits on screen and how big blocks are.
+
+        Memoized on the window and grid dimensions, which only change on
+        resize; the per-frame renderer call is a key compare plus a
+        cached dict return.
+        """
+        key = (self.width, self.height, self.grid_width,
+               self.grid_height, self.block_size)
+        if key == self._grid_params_key:
+            return self._grid_params_cache
+        grid_pixel_width = self.grid_width * self.block_size
+        grid_pixel_height = self.grid_height * self.block_size
+        offset_x = int((self.width - grid_pixel_width) / 2)
+        offset_y = int((self.height - grid_pixel_height) / 2)
+        scale = self.block_size / 32.0
+        params = {
+            'offset_x': offset_x,
+            'offset_y': offset_y,
+            'block_size': self.block_size,
+            'grid_pixel_width': grid_pixel_width,
+            'grid_pixel_height': grid_pixel_height,
+            'scale': scale,
+        }
+        self._grid_params_key = key
+        self._grid_params_cache = params
+        return params
+
+    def build_blit_list(self):
+        """Blit batch for every settled block, for Surface.blits().
+
+        Walks only the nonzero cells of the visible rows; the renderer
+        passes the result to screen.blits() so the per-blit Python/C
+        round-trip is paid once for the whole grid.
+        """
+        params = self.get_grid_screen_params()
+        offset_x = params['offset_x']
+        offset_y = params['offset_y']
+        block_size = self.block_size
+
+        # While nothing falls, block positions only change with the
+        # grid, so the assembled batch is reusable across frames.
+        static = not self.animating_gravity_blocks
+        key = (self._grid_version, offset_x, offset_y, block_size)
+        if static and key == self._blit_cache_key:
+            return self._blit_cache
+
+        buffer_rows = self.buffer_rows
+        grid = self.puzzle_grid
+        surfaces = self.block_surfaces
+
+        blits = []
+        ys, xs = np.nonzero(grid[buffer_rows:])
+        for y, x in zip(ys.tolist(), xs.tolist()):
+            grid_y = y + buffer_rows
+            vx, vy = self.get_block_visual_position(x, grid_y)
+            blits.append((surfaces[int(grid[grid_y, x])],
+                          (offset_x + vx * block_size,
+                           offset_y + (vy - buffer_rows) * block_size)))
+        if static:
+            self._blit_cache_key = key
+            self._blit_cache = blits
+        else:
+            self._blit_cache_key = None
+        return blits
+
+    def _mark_grid_dirty(self):
+        """Note a grid mutation: clusters and the blit batch re-derive."""
+        self._clusters_dirty = True
+        self._grid_version += 1
+
+    def is_valid_position(self, x, y):
+        """Return True if (x, y) is inside the grid and unoccupied."""
+        if x < 0 or x >= self.grid_width:
+            return False
+        if y >= self.total_grid_height:
+            return False
+        if y < 0:
+            # Above the buffer rows; treated as open space for spawning.
+            return True
+        if self.puzzle_grid[y, x]:
+            return False
+        return True
+
+    # ------------------------------------------------------------------
+    # Piece generation
+    # ------------------------------------------------------------------
+
+    def _refill_piece_queue(self):
+        """Draw a fresh batch of piece ids in one vectorized RNG call."""
+        rolls = self._rng.random(256)
+        # Base 1 for normal colors, 5 for breakers (~25% of the time),
+        # plus a uniform color offset 0-3.
+        ids = np.where(rolls < 0.25, 5, 1) + self._rng.integers(0, 4, 256)
+        self._piece_id_queue.extend(ids.tolist())
+
+    def generate_random_piece(self):
+        """Pick a random piece type; breakers show up ~25% of the time."""
+        if not self._piece_id_queue:
+            self._refill_piece_queue()
+        return ID_PIECE[self._piece_id_queue.popleft()]
+
+    def generate_new_piece(self):
+        """Take the next piece pair from the queue and spawn it."""
+        while len(self.next_piece_queue) < 4:
+            self.next_piece_queue.append(self.generate_random_piece())
+
+        self.piece_type = self.next_piece_queue.pop(0)
+        self.attached_piece_type = self.next_piece_queue.pop(0)
+        self.piece_position = [self.grid_width // 2, 1]
+        self.attached_position = 0
+        self.sub_position = 0
+        self.current_fall_speed = self.normal_fall_speed
+        self.micro_fall_time = self._calculate_micro_fall_time(self.current_fall_speed)
+        now = pygame.time.get_ticks()
+        self.last_fall_time = now
+        self.piece_generation_time = now
+        self.piece_active = True
+
+        # The spacebar may still be held from the previous piece; drop it so
+        # the new piece doesn't instantly fast-fall.
+        if self.input_handler is not None:
+            self.input_handler.clear_spacebar_from_keys()
+
+        # Game over when the spawn cell is already occupied.
+        spawn_x, spawn_y = self.piece_position
+        if self.puzzle_grid[spawn_y, spawn_x]:
+            self.game_active = False
+            self.piece_active = False
+
+    # ------------------------------------------------------------------
+    # Piece movement
+    # ------------------------------------------------------------------
+
+    def get_attached_position_coords(self):
+        """Grid coordinates of the attached block (memoized)."""
+        main_x, main_y = self.piece_position
+        key = (main_x, main_y, self.attached_position)
+        if key == self._attached_cache_key:
+            return self._attached_coords
+        dx, dy = self._ATTACH_OFFSETS[self.attached_position]
+        coords = [main_x + dx, main_y + dy]
+        self._attached_cache_key = key
+        self._attached_coords = coords
+        return coords
+
+    def move_piece(self, dx, dy):
+        """Try to move the piece pair by (dx, dy); return True on success."""
+        if not self.piece_active:
+            return False
+        main_x, main_y = self.piece_position
+        new_main_x = main_x + dx
+        new_main_y = main_y + dy
+
+        adx, ady = self._ATTACH_OFFSETS[self.attached_position]
+        attached_x, attached_y = new_main_x + adx, new_main_y + ady
+
+        # One attribute probe for the validity check, not one per call;
+        # the attached probe short-circuits away when the main cell is
+        # already blocked.
+        valid = self.is_valid_position
+        if not (valid(new_main_x, new_main_y) and
+                valid(attached_x, attached_y)):
+            return False
+
+        self.piece_position[0] = new_main_x
+        self.piece_position[1] = new_main_y
+        return True
+
+    def rotate_attached_piece(self, direction):
+        """Rotate the attached block around the main block.
+
+        direction is +1 for clockwise, -1 for counter-clockwise.  When the
+        target cell is blocked we try a simple one-cell wall kick.
+        """
+        if not self.piece_active:
+            return False
+        main_x, main_y = self.piece_position
+        new_position = (self.attached_position + direction) % 4
+
+        adx, ady = self._ATTACH_OFFSETS[new_position]
+        attached_x, attached_y = main_x + adx, main_y + ady
+
+        # One attribute probe for up to five validity checks below.
+        valid = self.is_valid_position
+        if valid(attached_x, attached_y):
+            self.attached_position = new_position
+            return True
+
+        # Wall kicks: push the main block one cell away from the wall the
+        # attached block ran into, then retry.
+        for kdx, kdy in self._KICK_TABLE[new_position]:
+            kx, ky = main_x + kdx, main_y + kdy
+            # Kicks never lift the main block out the top of the grid;
+            # is_valid_position treats y < 0 as open for spawning.
+            if ky < 0:
+                continue
+            if valid(kx, ky) and valid(kx + adx, ky + ady):
+                self.piece_position[0] = kx
+                self.piece_position[1] = ky
+                self.attached_position = new_position
+                return True
+        return False
+
+    def flip_pieces_vertically(self):
+        """Swap the main and attached blocks when stacked vertically."""
+        return self.piece_movement.flip_pieces_vertically()
+
+    # ------------------------------------------------------------------
+    # Falling piece update
+    # ------------------------------------------------------------------
+
+    @property
+    def micro_fall_time(self):
+        """Milliseconds per sub-grid fall step."""
+        return self._micro_fall_time
+
+    @micro_fall_time.setter
+    def micro_fall_time(self, value):
+        # Derived per speed change, not per frame: fast mode is where
+        # several sub-steps can come due in a single frame.
+        self._micro_fall_time = value
+        self._fast_fall_mode = value < 10
+
+    def _calculate_micro_fall_time(self, fall_speed):
+        """Milliseconds per sub-grid step for the given fall speed."""
+        micro = self._micro_cache.get(fall_speed)
+        if micro is None:
+            micro = max(1, int(fall_speed / float(self.sub_grid_positions)))
+            self._micro_cache[fall_speed] = micro
+        return micro
+
+    def update_falling_piece(self):
+        """Advance the falling piece by however many sub-steps are due."""
+        if not self.piece_active or not self.game_active:
+            return
+
+        # One timestamp for the whole invocation; every decision below
+        # shares the same 'now'.
+        current_time = pygame.time.get_ticks()
+
+        # Hold the piece while block animations play out.
+        if self.renderer is not None and \
+                self.renderer.animations_in_progress():
+            self.last_animation_wait_time = current_time
+            return
+        if self.last_animation_wait_time:
+            # Don't count time spent waiting on animations as fall time.
+            self.last_fall_time = current_time
+            self.last_animation_wait_time = 0
+
+        # Hot loop state bound to locals once; micro_fall_time only
+        # changes when the fall speed changes, and the attached offset
+        # only changes on rotation, neither of which happens mid-loop.
+        micro_fall_time = self.micro_fall_time
+        grid = self.puzzle_grid
+        pos = self.piece_position
+        elapsed = current_time - self.last_fall_time
+
+        if elapsed < micro_fall_time:
+            return
+
+        # With a very fast fall speed, several sub-steps can be due in one
+        # frame; cap it so a long stall can't teleport the piece.  The
+        # mode flag is derived when the speed changes, and the divisor
+        # is clamped >= 1 at its source in _calculate_micro_fall_time.
+        if self._fast_fall_mode:
+            max_steps = min(10, elapsed // micro_fall_time)
+        else:
+            max_steps = 1
+
+        # The whole sub-step loop is one compiled-kernel call; the
+        # Python side only applies the results and handles placement.
+        attached_dx = (0, 1, 0, -1)[self.attached_position]
+        attached_dy = (-1, 0, 1, 0)[self.attached_position]
+        steps_taken, new_sub, new_main_y, blocked = advance_fall_kernel(
+            grid, pos[0], pos[1], attached_dx, attached_dy,
+            self.attached_position, self.sub_position,
+            self.sub_grid_positions, self._fall_check_threshold, max_steps)
+        self.sub_position = new_sub
+        pos[1] = new_main_y
+
+        if blocked:
+            if not self.would_fit_below():
+                self.place_piece_on_grid()
+                return
+            # A cluster below is still settling; wait for it.
+
+        if steps_taken > 0:
+            self.last_fall_time = current_time
+            if self.logger is not None:
+                self.logger.debug("piece fell %d sub-steps" % steps_taken)
+
+    def would_fit_below(self):
+        """Check whether the piece pair has room to keep falling."""
+        if self._clusters_dirty:
+            self.detect_clusters()
+        main_x, main_y = self.piece_position
+        attached_x, attached_y = self.get_attached_position_coords()
+        return bool(would_fit_below_kernel(
+            self.puzzle_grid, self._cluster_mask, main_x, main_y,
+            attached_x, attached_y, self.attached_position))
+
+    # ------------------------------------------------------------------
+    # Piece placement
+    # ------------------------------------------------------------------
+
+    def place_piece_on_grid(self):
+        """Lock the current piece pair into the grid and kick off settling."""
+        main_x, main_y = self.piece_position
+        attached_x, attached_y = self.get_attached_position_coords()
+
+        pieces_to_place = [
+            (main_x, main_y, self.piece_type),
+            (attached_x, attached_y, self.attached_piece_type),
+        ]
+        self.place_pieces(pieces_to_place)
+        self.piece_active = False
+        self.sub_position = 0
+
+        self.apply_gravity()
+        self.find_and_activate_breakers()
+        if not self.chain_reaction_in_progress:
+            self.generate_new_piece()
+
+    def place_pieces(self, pieces_to_place):
+        """Write a batch of pieces into the grid.
+
+        When two pieces land on the same cell, breakers win over normal
+        blocks and lower pieces win over higher ones.
+        """
+        # Write in ascending priority so the highest-priority piece for
+        # a cell lands last and wins; no per-cell compare-and-update.
+        ranked = sorted(
+            ((PIECE_ID[piece], x, y) for x, y, piece in pieces_to_place
+             if 0 <= x < self.grid_width and
+             0 <= y < self.total_grid_height),
+            key=lambda t: (BREAKER_ID_MIN <= t[0] <= BREAKER_ID_MAX, t[2]))
+        for piece_id, x, y in ranked:
+            self.puzzle_grid[y, x] = piece_id
+        if ranked:
+            self._mark_grid_dirty()
+
+    # ------------------------------------------------------------------
+    # Gravity
+    # ------------------------------------------------------------------
+
+    def apply_gravity(self):
+        """Let unsupported blocks fall straight down.
+
+        Returns True if anything moved.  Blocks that are part of a
+        supported cluster stay put; garbage movements are recorded so the
+        attack system can track its blocks.
+        """
+        blocks_moved = False
+        garbage_movements = []
+        cluster_mask = self.detect_clusters()
+        grid = self.puzzle_grid
+        height = self.total_grid_height
+
+        # Blocks of a supported cluster stay put; everything else falls.
+        # Each supported component is flood-filled once, not per cell.
+        frozen = set()
+        seen = set()
+        cys, cxs = np.nonzero(cluster_mask)
+        for cx, cy in zip(cxs.tolist(), cys.tolist()):
+            if (cx, cy) in seen:
+                continue
+            component = self.find_connected_pieces(cx, cy,
+                                                   COLOR_ID[grid[cy, cx]])
+            seen.update(component)
+            if self.is_cluster_supported(component):
+                frozen.update(component)
+
+        flat = self._grid_flat
+        width = self.grid_width
+        for x in range(width):
+            # Strided view over the flat buffer: one multiply-add per
+            # element, no 2D index math.
+            col = flat[x::width]
+            # Frozen rows split the column into independent segments;
+            # with no frozen cells this is one compaction for the column.
+            boundaries = sorted(y for (fx, y) in frozen if fx == x)
+            seg_top = 0
+            for seg_end in boundaries + [height]:
+                seg = col[seg_top:seg_end]
+                seg_top = seg_end + 1
+                if len(seg) < 2:
+                    continue
+                nz = np.flatnonzero(seg)
+                n = len(nz)
+                if n == 0 or nz[0] == len(seg) - n:
+                    # Empty or already compacted.
+                    continue
+                vals = seg[nz].copy()
+                new_rows = np.arange(len(seg) - n, len(seg))
+                seg[:] = EMPTY
+                seg[len(seg) - n:] = vals
+                blocks_moved = True
+                base = seg_end - len(seg)
+                for old_r, new_r, piece in zip(nz, new_rows, vals):
+                    if old_r == new_r:
+                        continue
+                    old_y = base + int(old_r)
+                    new_y = base + int(new_r)
+                    if piece >= GARBAGE_ID_MIN:
+                        garbage_movements.append((x, old_y, x, new_y))
+                    record = {
+                        'x': x,
+                        'y': old_y,
+                        'target_y': new_y,
+                        'progress': 0.0,
+                        'block_type': int(piece),
+                    }
+                    self.animating_gravity_blocks.append(record)
+                    self._animating_by_source[(x, old_y)] = record
+
+        self.garbage_movements = garbage_movements
+        if blocks_moved:
+            self._mark_grid_dirty()
+        return blocks_moved
+
+    def update_gravity_animations(self, dt=16):
+        """Advance falling-block animations; settle when they complete."""
+        if not self.animating_gravity_blocks:
+            return
+
+        # Swap-pop completed entries during the walk instead of
+        # rebuilding the list; order is irrelevant to the consumers.
+        blocks = self.animating_gravity_blocks
+        i = 0
+        n = len(blocks)
+        completed = False
+        while i < n:
+            block = blocks[i]
+            distance = max(1, block['target_y'] - block['y'])
+            block['progress'] += dt / (80.0 * distance)
+            if block['progress'] >= 1.0:
+                n -= 1
+                blocks[i] = blocks[n]
+                blocks.pop()
+                self._animating_by_source.pop((block['x'], block['y']),
+                                              None)
+                completed = True
+            else:
+                i += 1
+
+        # The list can only have drained on a frame where something
+        # completed; skip the settle check on all other frames.
+        if completed and not blocks:
+            # Anything still floating?  One vectorized compare of each
+            # row against the row below it replaces the cell loop.
+            grid = self.puzzle_grid
+            if ((grid[:-1] != EMPTY) & (grid[1:] == EMPTY)).any():
+                self.apply_gravity()
+
+    def get_block_visual_position(self, grid_x, grid_y):
+        """Screen-space grid position of a block, including fall animation."""
+        block = self._animating_by_source.get((grid_x, grid_y))
+        if block is not None:
+            visual_y = block['y'] + \
+                (block['target_y'] - block['y']) * block['progress']
+            return (grid_x, visual_y)
+        return (grid_x, grid_y)
+
+    # ------------------------------------------------------------------
+    # Cluster detection
+    # ------------------------------------------------------------------
+
+    def detect_clusters(self):
+        """Find all 2x2 (or larger) same-color rectangles of normal blocks.
+
+        Returns a boolean [y, x] mask marking every block that is part of
+        such a rectangle.  The mask, the component labels and the
+        component count are all cached and only recomputed after the
+        grid has mutated; larger rectangles fall out of the 2x2 scan
+        because every cell of one is itself part of some 2x2 block.
+        """
+        if self._clusters_dirty:
+            self._cluster_label_count = detect_and_label(
+                self.puzzle_grid, self._cluster_mask, self._cluster_labels)
+            self._all_clusters_cache = None
+            self._clusters_dirty = False
+        return self._cluster_mask
+
+    def find_all_clusters(self):
+        """Group cluster blocks into connected same-color components."""
+        self.detect_clusters()
+        if self._all_clusters_cache is not None:
+            return self._all_clusters_cache
+        labels = self._cluster_labels
+        count = self._cluster_label_count
+        components = [set() for _ in range(count)]
+        if count:
+            ys, xs = np.nonzero(labels)
+            for x, y, label in zip(xs.tolist(), ys.tolist(),
+                                   labels[ys, xs].tolist()):
+                components[label - 1].add((x, y))
+        self._all_clusters_cache = components
+        return components
+
+    def find_connected_pieces(self, start_x, start_y, color):
+        """Flood-fill all blocks of the given color id connected to a cell.
+
+        Returns the cells in BFS order from the start; callers use the
+        index for staggered break delays.
+        """
+        out_x = self._flood_out_x
+        out_y = self._flood_out_y
+        count = flood_same_color(self.puzzle_grid, start_x, start_y,
+                                 color, out_x, out_y)
+        return list(zip(out_x[:count].tolist(), out_y[:count].tolist()))
+
+    def is_cluster_supported(self, cluster_blocks):
+        """True if the cluster rests on the floor or on outside blocks."""
+        if not cluster_blocks:
+            return True
+        xs, ys = zip(*cluster_blocks)
+        # Bottom-most cluster row per column, -1 for untouched columns.
+        bottoms = np.full(self.grid_width, -1, dtype=np.int32)
+        np.maximum.at(bottoms, np.asarray(xs), np.asarray(ys))
+        cols = np.flatnonzero(bottoms >= 0)
+        below = bottoms[cols] + 1
+        # Columns whose bottom row is the last grid row rest on the floor.
+        in_field = below < self.total_grid_height
+        # The cell under a column's bottom-most block can never itself be
+        # in the cluster, so occupied is sufficient for support.
+        return bool(np.all(self.puzzle_grid[below[in_field],
+                                            cols[in_field]]))
+
+    # ------------------------------------------------------------------
+    # Breakers and chain reactions
+    # ------------------------------------------------------------------
+
+    def find_breakers_to_activate(self):
+        """Scan for breaker blocks adjacent to a same-color block.
+
+        Activated breakers, plus every connected block of that color, are
+        queued into self.breaking_blocks with a staggered delay.  Returns
+        True if any breaker activated.
+        """
+        # One SDL tick query per frame: update() stamps frame_tick and
+        # every chain/breaker decision this frame reuses it.
+        current_time = self.frame_tick
+        found_any = False
+        grid = self.puzzle_grid
+
+        # Whole-grid neighbor test in a few shifted comparisons: a
+        # breaker activates when any 4-neighbor is a normal block (only
+        # ids 1-4 trigger) of the breaker's color.
+        is_breaker = (grid >= BREAKER_ID_MIN) & (grid <= BREAKER_ID_MAX)
+        if not is_breaker.any():
+            return False
+        color = COLOR_ID_ARR[grid]
+        normal = (grid >= 1) & (grid <= 4)
+        same = np.zeros(grid.shape, dtype=np.bool_)
+        same[:, :-1] |= normal[:, 1:] & (color[:, :-1] == color[:, 1:])
+        same[:, 1:] |= normal[:, :-1] & (color[:, 1:] == color[:, :-1])
+        same[:-1, :] |= normal[1:, :] & (color[:-1, :] == color[1:, :])
+        same[1:, :] |= normal[:-1, :] & (color[1:, :] == color[:-1, :])
+        bys, bxs = np.nonzero(is_breaker & same)
+
+        for x, y in zip(bxs.tolist(), bys.tolist()):
+            breaker_color = COLOR_ID[grid[y, x]]
+            # Same neighbor priority as the old scan: the breaker fires
+            # on its first matching neighbor only; disjoint regions on
+            # other sides are caught by the next scan of the chain.
+            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                nx, ny = x + dx, y + dy
+                if nx < 0 or nx >= self.grid_width:
+                    continue
+                if ny < 0 or ny >= self.total_grid_height:
+                    continue
+                neighbor = grid[ny, nx]
+                if neighbor != breaker_color:
+                    continue
+
+                if __debug__ and DEBUG_BREAKERS:
+                    print(f"DEBUG: Breaker at ({x},{y}) activating on "
+                          f"{ID_PIECE[int(neighbor)]} at ({nx},{ny})")
+                connected = self.find_connected_pieces(nx, ny,
+                                                      breaker_color)
+                targets = connected + [(x, y)]
+                delay = 0
+                breaking_positions = self._breaking_positions
+                for (block_x, block_y) in targets:
+                    if (block_x, block_y) in breaking_positions:
+                        continue
+                    breaking_positions.add((block_x, block_y))
+                    block_type = int(grid[block_y, block_x])
+                    is_break = BREAKER_ID_MIN <= block_type <= BREAKER_ID_MAX
+                    self.breaking_blocks.append(
+                        (block_x, block_y, current_time, delay,
+                         block_type, is_break))
+                    delay += 30
+                    found_any = True
+                break
+
+        if found_any:
+            self.breaking_animation_start = current_time
+            if __debug__ and DEBUG_BREAKERS:
+                print(f"DEBUG: {len(self.breaking_blocks)} blocks "
+                      f"queued to break")
+        return found_any
+
+    def find_and_activate_breakers(self):
+        """Run a breaker scan and enter the chain-reaction state if it hit."""
+        current_time = self.frame_tick
+        if self.find_breakers_to_activate():
+            # find_breakers_to_activate already stamped
+            # breaking_animation_start; it is the sole owner.
+            self.chain_reaction_in_progress = True
+            self.chain_state = "breaking"
+            self.chain_count += 1
+            if not self.chain_start_time:
+                self.chain_start_time = current_time
+            return True
+        return False
+
+    def clear_breaking_blocks(self):
+        """Remove all queued breaking blocks from the grid."""
+        if not self.breaking_blocks:
+            return
+
+        # Average position, used as the particle burst origin.
+        total_x = 0
+        total_y = 0
+        for bx, by, _, _, _, _ in self.breaking_blocks:
+            total_x += bx
+            total_y += by
+        center_x = total_x / len(self.breaking_blocks)
+        center_y = total_y / len(self.breaking_blocks)
+
+        for bx, by, _, _, block_type, is_breaker in self.breaking_blocks:
+            if __debug__ and DEBUG_BREAKERS:
+                print(f"DEBUG: clearing {ID_PIECE.get(block_type)} "
+                      f"at ({bx},{by})")
+            self.puzzle_grid[by, bx] = EMPTY
+            self.score += 20 if is_breaker else 10
+
+        if self.renderer is not None:
+            self.renderer.spawn_break_particles(center_x, center_y)
+
+        self.breaking_blocks = []
+        self._breaking_positions.clear()
+        self._mark_grid_dirty()
+        self.process_transformed_garbage_blocks()
+
+    def process_transformed_garbage_blocks(self):
+        """Turn garbage adjacent to a cleared area into normal blocks."""
+        gray_id = PIECE_ID['gray_garbage']
+        for y in range(self.total_grid_height):
+            for x in range(self.grid_width):
+                cell = self.puzzle_grid[y, x]
+                if cell < GARBAGE_ID_MIN or cell == gray_id:
+                    continue
+                # Colored garbage becomes a normal block of its color.
+                self.puzzle_grid[y, x] = COLOR_ID[cell]
+                self._mark_grid_dirty()
+
+    def _end_chain(self):
+        """Tear the chain reaction down and hand control back."""
+        self.chain_reaction_in_progress = False
+        self.chain_state = "idle"
+        self.chain_start_time = 0
+        self.chain_count = 0
+        if not self.piece_active and self.game_active:
+            self.generate_new_piece()
+
+    def _chain_breaking(self, current_time):
+        if current_time - self.breaking_animation_start >= \
+                self.breaking_animation_duration:
+            self.clear_breaking_blocks()
+            self.apply_gravity()
+            self.chain_state = "waiting_for_gravity"
+            self.last_state_change = current_time
+
+    def _chain_waiting_for_gravity(self, current_time):
+        if not self.animating_gravity_blocks:
+            if self.apply_gravity():
+                self.last_state_change = current_time
+            elif self.find_breakers_to_activate():
+                self.chain_state = "breaking"
+                self.chain_count += 1
+                self.last_state_change = current_time
+            else:
+                self._end_chain()
+        elif current_time - self.last_state_change > 5000:
+            # Animations are stuck; end the chain.
+            self._end_chain()
+
+    def _chain_waiting_for_breaking(self, current_time):
+        if not self.breaking_blocks:
+            self._end_chain()
+
+    def update_chain_reaction(self):
+        """Advance the chain reaction state machine one tick."""
+        if self.chain_state == "idle":
+            return
+
+        current_time = self.frame_tick
+
+        # Global safety timeout so a stuck chain can't freeze the game.
+        if self.chain_start_time and \
+                current_time - self.chain_start_time > 10000:
+            self._end_chain()
+            return
+
+        handler = self._chain_handlers.get(self.chain_state)
+        if handler is not None:
+            handler(current_time)
+
+    # ------------------------------------------------------------------
+    # Per-frame update
+    # ------------------------------------------------------------------
+
+    def update(self):
+        """Advance the whole engine by one frame."""
+        self.frame_tick = pygame.time.get_ticks()
+        if not self.game_active:
+            return
+        if self.piece_active and not self.chain_reaction_in_progress:
+            self.update_falling_piece()
+        self.update_chain_reaction()
+        self.update_gravity_animations()
+
+    def handle_button_action(self, action):
+        """Dispatch a clicked UI button."""
+        if action == 'start':
+            self.start_game()
+        elif action == 'quit':
+            self.game_active = False
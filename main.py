@@ -0,0 +1,74 @@
+import pygame
+
+from core.puzzle_module import PuzzleEngine, PIECE_ID
+from core.input_handler import InputHandler, HANDLED_EVENT_TYPES
+
+# Surface.fblits (pygame-ce) skips per-item flag parsing and returns
+# nothing; fall back to blits on plain pygame.
+_HAVE_FBLITS = hasattr(pygame.Surface, 'fblits')
+
+
+def draw_frame(screen, engine):
+    screen.fill((18, 18, 26))
+    params = engine.get_grid_screen_params()
+    offset_x = params['offset_x']
+    offset_y = params['offset_y']
+    block_size = params['block_size']
+
+    surfaces = engine.block_surfaces
+
+    # One batched call for the whole settled grid; the engine caches
+    # the batch between grid changes.  doreturn=0 skips building the
+    # list of dirty rects we would ignore anyway.
+    batch = engine.build_blit_list()
+    if _HAVE_FBLITS:
+        screen.fblits(batch)
+    else:
+        screen.blits(batch, doreturn=0)
+
+    if engine.piece_active:
+        main_x, main_y = engine.piece_position
+        attached_x, attached_y = engine.get_attached_position_coords()
+        visual_offset = engine.sub_position / float(engine.sub_grid_positions)
+        for (px, py, ptype) in ((main_x, main_y, engine.piece_type),
+                                (attached_x, attached_y,
+                                 engine.attached_piece_type)):
+            surf = surfaces[PIECE_ID.get(ptype, 0)] or engine.gray_block
+            screen.blit(surf, (offset_x + px * block_size,
+                               offset_y + (py + visual_offset -
+                                           engine.buffer_rows) * block_size))
+
+    # One full flip per frame.  Dirty-rect updates are a net loss here:
+    # chain reactions touch dozens of cells at once, and on SDL2 a full
+    # flip beats display.update() with that many small rects.
+    pygame.display.flip()
+
+
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    pygame.display.set_caption("Blade Fighters - Puzzle Battle")
+    clock = pygame.time.Clock()
+
+    engine = PuzzleEngine(800, 600)
+    input_handler = InputHandler(engine)
+    engine.input_handler = input_handler
+    engine.start_game()
+
+    running = True
+    while running:
+        pygame.event.pump()
+        events = pygame.event.get(HANDLED_EVENT_TYPES)
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+        input_handler.process_events(events)
+        engine.update()
+        draw_frame(screen, engine)
+        clock.tick(60)
+
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()